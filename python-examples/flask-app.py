@@ -1,14 +1,285 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, SoupStrainer
 import re
-from urllib.parse import urljoin, urlparse
+import sys
+from urllib.parse import urljoin, urlsplit, urlunsplit
+import asyncio
+import codecs
 import logging
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Thread
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional async client for the stylesheet fan-out; HTTP/2 additionally needs h2
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    import h2  # noqa: F401
+    HTTP2_ENABLED = httpx is not None
+except ImportError:
+    HTTP2_ENABLED = False
+
+# Prefer the C-backed lxml parser; fall back to the stdlib parser if unavailable
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# Only <link> and <style> elements are relevant to font detection
+_FONT_STRAINER = SoupStrainer(['link', 'style'])
+
+# When google-re2 is installed it compiles _CSS_RE and _GF_FAMILY_RE only, for
+# RE2's guaranteed linear-time matching; throughput is on par with re here.
+# Other patterns stay on re because re2's Python-level sub() is much slower.
+try:
+    import re2 as _css_re
+except ImportError:
+    _css_re = re
+
+# Precompiled patterns used while scanning HTML/CSS. Flags are inlined as
+# (?i) because re2.compile does not accept re-style flag arguments.
+# Google Fonts @import rules and font-family declarations are matched in one scan
+_CSS_RE = _css_re.compile(
+    r'(?i)@import\s+url\([\'"]?(?P<imp>[^\'")]*fonts\.googleapis\.com[^\'")]*)[\'"]?\)'
+    r'|font-family\s*:\s*(?P<ff>[^;}]+)'
+)
+_GF_FAMILY_RE = _css_re.compile(r'family=([^&]*)')
+
+# Comment stripping stays on stdlib re (see above)
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+
+# Generic families and CSS-wide keywords that are not real fonts
+_GENERIC_FAMILIES = frozenset({
+    'serif', 'sans-serif', 'monospace', 'cursive', 'fantasy',
+    'system-ui', 'ui-serif', 'ui-sans-serif', 'ui-monospace', 'ui-rounded',
+    'emoji', 'math', 'fangsong',
+    'inherit', 'initial', 'unset', 'revert'
+})
+
+# Removes quote characters from font family names in a single pass
+_QUOTE_TRANS = str.maketrans('', '', '\'"')
+
+# Tokens _CSS_RE starts its matches with; CSS without either cannot match
+_CSS_TOKENS = ('font-family', '@import')
+_CSS_TOKENS_BYTES = tuple(token.encode() for token in _CSS_TOKENS)
+
+
+def may_contain_fonts(css):
+    """Cheap prefilter for str or bytes CSS before the regex scan."""
+    # Lowercasing keeps the check case-insensitive like _CSS_RE while the
+    # substring searches themselves run at memchr/memmem speed
+    lowered = css.lower()
+    tokens = _CSS_TOKENS_BYTES if isinstance(css, bytes) else _CSS_TOKENS
+    return any(token in lowered for token in tokens)
+
+# Shared HTTP session so page and stylesheet fetches reuse keep-alive connections
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept-Encoding': 'gzip, deflate'
+})
+_SESSION.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=32))
+_SESSION.mount('http://', HTTPAdapter(pool_connections=32, pool_maxsize=32))
+
+# Maximum number of stylesheets fetched in parallel per page
+CSS_FETCH_WORKERS = 8
+
+# Upper bounds on downloaded (decompressed) body sizes
+MAX_PAGE_BYTES = 5_000_000
+MAX_CSS_BYTES = 2_000_000
+
+
+def read_capped(response, max_bytes):
+    """Read a streamed response body, returning None if it exceeds max_bytes."""
+    content_length = response.headers.get('Content-Length')
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        return None
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        size += len(chunk)
+        if size > max_bytes:
+            return None
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+async def read_capped_async(response, max_bytes):
+    """Async counterpart of read_capped for streamed httpx responses."""
+    content_length = response.headers.get('Content-Length')
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        return None
+    chunks = []
+    size = 0
+    async for chunk in response.aiter_bytes(chunk_size=64 * 1024):
+        size += len(chunk)
+        if size > max_bytes:
+            return None
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def normalize_url(parsed):
+    """Canonicalize a split URL so equivalent spellings share a cache entry."""
+    # Only the host is case-insensitive; userinfo must keep its original case
+    userinfo, at, hostport = parsed.netloc.rpartition('@')
+    return urlunsplit(parsed._replace(
+        scheme=parsed.scheme.lower(),
+        netloc=userinfo + at + hostport.lower(),
+        path=parsed.path or '/',
+        fragment=''
+    ))
+
+
+def css_charset(response):
+    """Charset for decoding a stylesheet, independent of the HTTP client."""
+    # requests and httpx disagree on the default for text/css (ISO-8859-1 vs
+    # utf-8), so only an explicit charset parameter is honored; CSS defaults
+    # to UTF-8, and utf-8-sig also drops a leading BOM
+    for param in response.headers.get('Content-Type', '').split(';')[1:]:
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'charset':
+            charset = value.strip().strip('\'"')
+            try:
+                if codecs.lookup(charset).name != 'utf-8':
+                    return charset
+            except LookupError:
+                pass
+            break
+    return 'utf-8-sig'
+
+
+@lru_cache(maxsize=2048)
+def join_url(base, href):
+    # Pages commonly repeat the same relative hrefs, and sites are rescanned
+    return urljoin(base, href)
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ttl seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class FontCollection:
+    """Deduplicated fonts stored as parallel lists of interned strings."""
+
+    def __init__(self):
+        self.families = []
+        self.types = []
+        self.sources = []
+        self._seen = set()
+
+    def __len__(self):
+        return len(self.families)
+
+    def add(self, family, font_type, source):
+        family = sys.intern(family)
+        key = (family, font_type)
+        if key not in self._seen:
+            self._seen.add(key)
+            self.families.append(family)
+            self.types.append(font_type)
+            self.sources.append(sys.intern(source))
+
+    def extend(self, other):
+        for family, font_type, source in zip(other.families, other.types, other.sources):
+            self.add(family, font_type, source)
+
+    def to_dicts(self):
+        return [
+            {'family': family, 'type': font_type, 'source': source}
+            for family, font_type, source in zip(self.families, self.types, self.sources)
+        ]
+
+
+# Recent scan results, keyed by normalized page URL
+_RESULT_CACHE = TTLCache(maxsize=1024, ttl=300)
+
+# Validators and parsed fonts of fetched stylesheets, keyed by CSS URL
+_CSS_CACHE = TTLCache(maxsize=512, ttl=24 * 60 * 60)
+
+# Event loop thread and AsyncClient shared by all scans in this process, so
+# stylesheet connections stay pooled across requests; started lazily so
+# forking WSGI servers create them in each worker rather than the master
+_ASYNC_LOCK = Lock()
+_ASYNC_LOOP = None
+_ASYNC_CLIENT = None
+
+
+def get_async_runtime():
+    """Return the shared (event loop, AsyncClient), starting them on first use."""
+    global _ASYNC_LOOP, _ASYNC_CLIENT
+    with _ASYNC_LOCK:
+        if _ASYNC_LOOP is None:
+            loop = asyncio.new_event_loop()
+            Thread(target=loop.run_forever, name='css-fetch-loop', daemon=True).start()
+            # With HTTP/2 the stylesheets of an origin share a single connection
+            _ASYNC_CLIENT = httpx.AsyncClient(
+                http2=HTTP2_ENABLED,
+                headers=dict(_SESSION.headers),
+                timeout=5.0,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=64)
+            )
+            _ASYNC_LOOP = loop
+    return _ASYNC_LOOP, _ASYNC_CLIENT
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes with orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 
 app = Flask(__name__)
 CORS(app)
 
+# Use orjson for jsonify() and request.get_json() when it is installed
+if orjson is not None:
+    app.json = ORJSONProvider(app)
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -100,6 +371,9 @@ HTML_TEMPLATE = """
 </html>
 """
 
+# The template has no Jinja placeholders, so serve it as-is instead of re-rendering
+_RENDERED_INDEX = HTML_TEMPLATE
+
 class FontAnalyzer:
     def __init__(self):
         self.google_fonts = [
@@ -107,112 +381,191 @@ class FontAnalyzer:
             'Raleway', 'Poppins', 'Oswald', 'Nunito', 'Ubuntu', 'Mulish',
             'Inter', 'Playfair Display', 'Merriweather', 'PT Sans'
         ]
+        # Lowercased once so lookups are a single hash probe
+        self._gf_lower = frozenset(gf.lower() for gf in self.google_fonts)
         
     def is_google_font(self, font_name):
-        return any(gf.lower() in font_name.lower() for gf in self.google_fonts)
+        return font_name.strip().lower() in self._gf_lower
     
-    def extract_fonts_from_css(self, css_content, base_url):
-        fonts = []
-        
-        # Find @import statements for Google Fonts
-        import_pattern = r'@import\s+url\([\'"]?([^\'")]*fonts\.googleapis\.com[^\'")]*)[\'"]?\)'
-        imports = re.findall(import_pattern, css_content)
-        
-        for import_url in imports:
-            # Extract family parameter from Google Fonts URL
-            family_match = re.search(r'family=([^&]*)', import_url)
-            if family_match:
-                families = family_match.group(1).replace('+', ' ').split('|')
-                for family in families:
-                    clean_family = family.split(':')[0]
-                    fonts.append({
-                        'family': clean_family,
-                        'type': 'google',
-                        'source': import_url
-                    })
+    def extract_fonts_from_css(self, css_content, base_url, fonts=None, prefiltered=False):
+        if fonts is None:
+            fonts = FontCollection()
+        if not prefiltered and not may_contain_fonts(css_content):
+            return fonts
+        # Comments may mention font-family in documentation, so drop them first
+        if '/*' in css_content:
+            css_content = _CSS_COMMENT_RE.sub('', css_content)
         
-        # Find font-family declarations
-        font_family_pattern = r'font-family\s*:\s*([^;}]+)'
-        declarations = re.findall(font_family_pattern, css_content, re.IGNORECASE)
-        
-        for declaration in declarations:
+        for match in _CSS_RE.finditer(css_content):
+            if match.lastgroup == 'imp':
+                # Extract family parameter from Google Fonts @import URL
+                import_url = match.group('imp')
+                family_match = _GF_FAMILY_RE.search(import_url)
+                if family_match:
+                    families = family_match.group(1).replace('+', ' ').split('|')
+                    for family in families:
+                        clean_family = family.partition(':')[0]
+                        fonts.add(clean_family, 'google', import_url)
+                continue
+            
             # Clean up the font family names
-            families = [f.strip().strip('\'"') for f in declaration.split(',')]
-            for family in families:
-                if family and family not in ['serif', 'sans-serif', 'monospace', 'cursive', 'fantasy']:
+            for family in match.group('ff').split(','):
+                family = family.strip().translate(_QUOTE_TRANS)
+                if family and family.lower() not in _GENERIC_FAMILIES:
                     font_type = 'google' if self.is_google_font(family) else 'web'
-                    fonts.append({
-                        'family': family,
-                        'type': font_type,
-                        'source': 'css'
-                    })
+                    fonts.add(family, font_type, 'css')
         
         return fonts
     
+    def conditional_headers(self, cached):
+        # Revalidate previously seen stylesheets with a conditional GET
+        headers = {}
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return headers
+    
+    def is_css_response(self, css_response):
+        # Redirects to HTML error pages or other non-CSS bodies are not scanned
+        content_type = css_response.headers.get('Content-Type', '').lower()
+        return not content_type or 'css' in content_type
+    
+    def process_css_response(self, css_url, css_response, body, cached):
+        if css_response.status_code == 304:
+            if cached is not None:
+                # Re-set the entry so a successful revalidation extends its TTL
+                _CSS_CACHE.set(css_url, cached)
+                return cached[2]
+            # Nothing to reuse without a cache entry for this stylesheet
+            logger.warning(f"Unexpected 304 without cached CSS from {css_url}")
+            return FontCollection()
+        if not 200 <= css_response.status_code < 300:
+            # Error pages are neither scanned nor cached
+            logger.warning(f"Skipping CSS with status {css_response.status_code} from {css_url}")
+            return FontCollection()
+        if not self.is_css_response(css_response):
+            content_type = css_response.headers.get('Content-Type')
+            logger.warning(f"Skipping non-CSS response ({content_type}) from {css_url}")
+            return FontCollection()
+        if body is None:
+            logger.warning(f"Skipping CSS larger than {MAX_CSS_BYTES} bytes: {css_url}")
+            return FontCollection()
+        
+        # Check the raw bytes first so stylesheets without fonts are never decoded
+        if may_contain_fonts(body):
+            css_text = body.decode(css_charset(css_response), errors='replace')
+            css_fonts = self.extract_fonts_from_css(css_text, css_url, prefiltered=True)
+        else:
+            css_fonts = FontCollection()
+        
+        etag = css_response.headers.get('ETag')
+        last_modified = css_response.headers.get('Last-Modified')
+        if etag or last_modified:
+            _CSS_CACHE.set(css_url, (etag, last_modified, css_fonts))
+        return css_fonts
+    
+    def fetch_css_fonts(self, css_url):
+        cached = _CSS_CACHE.get(css_url)
+        headers = self.conditional_headers(cached)
+        try:
+            with _SESSION.get(css_url, headers=headers, timeout=5, stream=True) as css_response:
+                body = None
+                if 200 <= css_response.status_code < 300 and self.is_css_response(css_response):
+                    body = read_capped(css_response, MAX_CSS_BYTES)
+                return self.process_css_response(css_url, css_response, body, cached)
+        except Exception as e:
+            logger.warning(f"Failed to fetch CSS from {css_url}: {e}")
+            return FontCollection()
+    
+    async def fetch_css_fonts_async(self, client, css_url):
+        cached = _CSS_CACHE.get(css_url)
+        headers = self.conditional_headers(cached)
+        try:
+            async with client.stream('GET', css_url, headers=headers) as css_response:
+                body = None
+                if 200 <= css_response.status_code < 300 and self.is_css_response(css_response):
+                    body = await read_capped_async(css_response, MAX_CSS_BYTES)
+                return self.process_css_response(css_url, css_response, body, cached)
+        except Exception as e:
+            logger.warning(f"Failed to fetch CSS from {css_url}: {e}")
+            return FontCollection()
+    
+    async def fetch_all_css_fonts_async(self, client, css_urls):
+        return await asyncio.gather(
+            *(self.fetch_css_fonts_async(client, css_url) for css_url in css_urls)
+        )
+    
+    def fetch_all_css_fonts(self, css_urls):
+        if httpx is not None:
+            # The client is bound to the loop thread, so work is submitted there
+            loop, client = get_async_runtime()
+            future = asyncio.run_coroutine_threadsafe(
+                self.fetch_all_css_fonts_async(client, css_urls), loop
+            )
+            return future.result()
+        with ThreadPoolExecutor(max_workers=min(CSS_FETCH_WORKERS, len(css_urls))) as executor:
+            return list(executor.map(self.fetch_css_fonts, css_urls))
+    
     def analyze_website(self, url):
         try:
             logger.info(f"Analyzing fonts for: {url}")
             
             # Fetch the webpage
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
+            with _SESSION.get(url, timeout=10, stream=True) as response:
+                response.raise_for_status()
+                content = read_capped(response, MAX_PAGE_BYTES)
+                # Trust an explicit charset so bs4 can skip encoding detection;
+                # requests' ISO-8859-1 default for text/* would mask <meta charset>
+                content_type = response.headers.get('Content-Type', '').lower()
+                encoding = response.encoding if 'charset=' in content_type else None
+            if content is None:
+                raise ValueError(f"Page exceeds {MAX_PAGE_BYTES} bytes")
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            fonts = []
+            soup = BeautifulSoup(
+                content, HTML_PARSER, parse_only=_FONT_STRAINER, from_encoding=encoding
+            )
+            fonts = FontCollection()
+            css_urls = []
             
-            # Check for Google Fonts link tags
-            google_font_links = soup.find_all('link', href=lambda x: x and 'fonts.googleapis.com' in x)
-            for link in google_font_links:
-                href = link.get('href')
-                # Extract family parameter
-                family_match = re.search(r'family=([^&]*)', href)
-                if family_match:
-                    families = family_match.group(1).replace('+', ' ').split('|')
-                    for family in families:
-                        clean_family = family.split(':')[0]
-                        fonts.append({
-                            'family': clean_family,
-                            'type': 'google',
-                            'source': href
-                        })
-            
-            # Analyze inline styles
-            style_tags = soup.find_all('style')
-            for style in style_tags:
-                if style.string:
-                    css_fonts = self.extract_fonts_from_css(style.string, url)
-                    fonts.extend(css_fonts)
+            # Walk <link> and <style> elements in a single pass
+            for element in soup.find_all(['link', 'style']):
+                if element.name == 'style':
+                    # Analyze inline styles
+                    if element.string:
+                        # Plain str: bs4's Stylesheet subclass breaks re2's sub()
+                        self.extract_fonts_from_css(str(element.string), url, fonts)
+                    continue
+                
+                href = element.get('href')
+                if not href:
+                    continue
+                
+                # Check for Google Fonts link tags
+                if 'fonts.googleapis.com' in href:
+                    family_match = _GF_FAMILY_RE.search(href)
+                    if family_match:
+                        families = family_match.group(1).replace('+', ' ').split('|')
+                        for family in families:
+                            clean_family = family.partition(':')[0]
+                            fonts.add(clean_family, 'google', href)
+                
+                # Queue external stylesheets
+                if 'stylesheet' in (element.get('rel') or []):
+                    css_urls.append(join_url(url, href))
             
             # Analyze external stylesheets
-            css_links = soup.find_all('link', rel='stylesheet')
-            for link in css_links:
-                href = link.get('href')
-                if href:
-                    try:
-                        css_url = urljoin(url, href)
-                        css_response = requests.get(css_url, headers=headers, timeout=5)
-                        css_fonts = self.extract_fonts_from_css(css_response.text, css_url)
-                        fonts.extend(css_fonts)
-                    except Exception as e:
-                        logger.warning(f"Failed to fetch CSS from {href}: {e}")
-            
-            # Remove duplicates
-            unique_fonts = []
-            seen = set()
-            for font in fonts:
-                font_key = f"{font['family']}-{font['type']}"
-                if font_key not in seen:
-                    seen.add(font_key)
-                    unique_fonts.append(font)
+            if css_urls:
+                for css_fonts in self.fetch_all_css_fonts(css_urls):
+                    fonts.extend(css_fonts)
             
-            logger.info(f"Found {len(unique_fonts)} unique fonts")
+            logger.info(f"Found {len(fonts)} unique fonts")
             return {
                 'success': True,
-                'fonts': unique_fonts,
-                'total_fonts': len(unique_fonts),
+                'fonts': fonts.to_dicts(),
+                'total_fonts': len(fonts),
                 'url': url
             }
             
@@ -224,13 +577,28 @@ class FontAnalyzer:
                 'fonts': [],
                 'url': url
             }
+    
+    def analyze_website_cached(self, url, parsed=None):
+        # The normalized URL is only the cache key; the caller's URL is fetched
+        # and echoed back as-is
+        key = normalize_url(parsed or urlsplit(url))
+        result = _RESULT_CACHE.get(key)
+        if result is not None:
+            logger.info(f"Cache hit for: {url}")
+            return {**result, 'url': url}
+        
+        result = self.analyze_website(url)
+        # Only successful scans are cached so transient failures are retried
+        if result.get('success'):
+            _RESULT_CACHE.set(key, result)
+        return result
 
 # Initialize the analyzer
 font_analyzer = FontAnalyzer()
 
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    return Response(_RENDERED_INDEX, mimetype='text/html')
 
 @app.route('/api/scan', methods=['POST'])
 def scan_fonts():
@@ -241,13 +609,13 @@ def scan_fonts():
         if not url:
             return jsonify({'error': 'URL is required'}), 400
         
-        # Validate URL
-        parsed = urlparse(url)
+        # Validate the URL once at the edge and reuse the split result
+        parsed = urlsplit(url)
         if not parsed.scheme or not parsed.netloc:
             return jsonify({'error': 'Invalid URL'}), 400
         
         # Analyze the website
-        result = font_analyzer.analyze_website(url)
+        result = font_analyzer.analyze_website_cached(url, parsed)
         
         return jsonify(result)
         
@@ -259,5 +627,7 @@ def scan_fonts():
 def health():
     return jsonify({'status': 'healthy', 'service': 'font-scanner-flask'})
 
+# For production, run under a WSGI server with threaded workers, e.g.:
+#   gunicorn -w 4 -k gthread --threads 16 -b 0.0.0.0:5000 'flask-app:app'
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file